@@ -1,61 +1,73 @@
 #!/usr/bin/env python3
 
+import functools
 import logging
 import configparser
 import subprocess
 import signal
-import uuid
+import shlex
+import shutil
 import sys
 import os
-import re
-
-from watchdog.events import FileSystemEventHandler
-from watchdog.observers import Observer
 
 # Create a job identifier (used to uniquely identify files)
-job = uuid.uuid4().hex
+job = os.urandom(16).hex()
 
 # Create a new logger for this job
 log = logging.getLogger(f"ffmpeg-remote-transcoder-{job[:6]}")
 
-# Load the ffmpeg-remote-transcoder configuration
-config = configparser.ConfigParser()
-config.read("/etc/frt.conf")
-
-# Configure logging
-logfile = config.get("Logging", "LogFile", fallback="/var/log/frt.log")
-logging.basicConfig(filename=logfile, level=logging.INFO)
-
-# Validate that the required parameters are set
-required_params = (("Server", "Host"), ("Server", "Username"), ("Server", "WorkingDirectory"))
-for param in required_params:
-    if not config.has_option(*param):
-        log.error(f"Missing required configuration option {param[0]}/{param[1]}")
-        exit()
-
-# Create the local working directory
-localdir = os.path.join(config.get("Client", "WorkingDirectory", fallback="/opt/frt/"), job)
-os.makedirs(localdir)
-
-# Predict the remote mounted working directory
-remotedir = os.path.join(config.get("Server", "WorkingDirectory"), job)
-
 # Parse the ffmpeg arguments to passthrough
 ffmpeg_args = sys.argv[1:]
 
-# Commands that should be redirected to stdout
-commands_bypass = { "-help", "-h", "-version", "-encoders", "-decoders", "-hwaccels" }
-bypass = len([ cmd for cmd in commands_bypass if cmd in ffmpeg_args ]) > 0
+# Determine whether this script is being run as ffprobe (rather than ffmpeg), which doesn't change during a run
+ffprobe = "ffprobe" in sys.argv[0]
 
-# Event handler for working directory changes
-class WorkingDirectoryMonitor(FileSystemEventHandler):
+# Commands that should be redirected to stdout
+commands_bypass = frozenset({ "-help", "-h", "-version", "-encoders", "-decoders", "-hwaccels" })
+bypass = not commands_bypass.isdisjoint(ffmpeg_args)
+
+# Local and remote working directories for this job, predicted by load_config()
+localdir = None
+remotedir = None
+
+# Settings resolved once by load_config(), so they don't have to be looked up again on each use
+ffmpeg_logfd = None
+host = None
+username = None
+identity_file = None
+persist = None
+control_path = None
+ffmpeg_paths = {}
+ffprobe_paths = {}
+write_timeout = None
+
+# The local working directory is held open once it has been created, so links can be made relative to it
+localfd = None
+
+# The output observer is kept reachable once it has been started, so cleanup can stop it before removing any links
+observer = None
+
+# Event handler for working directory changes (implements watchdog's handler interface without subclassing it, so
+# watchdog is only imported once monitoring actually begins)
+class WorkingDirectoryMonitor:
     def __init__(self, observer):
         self.observer = observer
 
+    def dispatch(self, event):
+        # Only file creation and deletion are handled, so drop everything else before it reaches a handler
+        if event.is_directory:
+            return
+
+        if event.event_type == "created":
+            self.on_created(event)
+        elif event.event_type == "deleted":
+            self.on_deleted(event)
+
     def paths(self, event):
         # Generate the various paths representing a single file
-        working = os.path.join(localdir, event.src_path)
-        relative = os.path.relpath(working, localdir)
+        destination = os.path.join(localdir, "dest")
+        working = os.path.join(destination, event.src_path)
+        relative = os.path.relpath(working, destination)
         absolute = os.path.join("/", relative)
 
         return working, absolute
@@ -74,7 +86,7 @@ class WorkingDirectoryMonitor(FileSystemEventHandler):
             # Link the destination output to the working copy
             os.link(working, absolute)
 
-            log.info(f"Linked destination file {absolute}")
+            log.info("Linked destination file %s", absolute)
 
     def on_deleted(self, event):
         _, absolute = self.paths(event)
@@ -84,103 +96,250 @@ class WorkingDirectoryMonitor(FileSystemEventHandler):
             # Remove the file
             os.unlink(absolute)
 
-            log.info(f"Unlinked destination file {absolute}")
+            log.info("Unlinked destination file %s", absolute)
+
+def load_config():
+    """
+    Loads and validates the ffmpeg-remote-transcoder configuration, resolving every setting once so they don't have to
+    be looked up again on each use
+    """
+    global localdir, remotedir
+    global ffmpeg_logfd, host, username, identity_file, persist, control_path
+    global ffmpeg_paths, ffprobe_paths, write_timeout
+
+    # Load the ffmpeg-remote-transcoder configuration
+    config = configparser.ConfigParser()
+    config.read("/etc/frt.conf")
+
+    # Configure logging
+    logfile = config.get("Logging", "LogFile", fallback="/var/log/frt.log")
+    logging.basicConfig(filename=logfile, level=logging.INFO)
+
+    # Optionally send ffmpeg's own output to a separate log file, opened now so a bad path can't abort a transcode that
+    # is already underway (ffmpeg's output is inherited from this program instead)
+    ffmpeg_logfile = config.get("Logging", "FfmpegLogFile", fallback=None)
+    if ffmpeg_logfile is not None:
+        try:
+            ffmpeg_logfd = os.open(ffmpeg_logfile, os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_CLOEXEC, 0o644)
+        except OSError as e:
+            log.warning("Failed to open ffmpeg log file %s, using standard error instead: %s", ffmpeg_logfile, e)
+
+    # Validate that the required parameters are set, stopping at the first missing one
+    required_params = (("Server", "Host"), ("Server", "Username"), ("Server", "WorkingDirectory"))
+    missing = next((param for param in required_params if not config.has_option(*param)), None)
+    if missing is not None:
+        log.error("Missing required configuration option %s/%s", *missing)
+        exit()
+
+    # Predict the local working directory, split into trees for linked source files (src) and ffmpeg output (dest)
+    localdir = os.path.join(config.get("Client", "WorkingDirectory", fallback="/opt/frt/"), job)
+
+    # Predict the remote mounted working directory
+    remotedir = os.path.join(config.get("Server", "WorkingDirectory"), job)
+
+    # Load the remote host configuration
+    host = config.get("Server", "Host")
+    username = config.get("Server", "Username")
+    identity_file = config.get("Server", "IdentityFile", fallback=None)
+    persist = config.get("Server", "Persist", fallback=120)
+
+    # Keep the SSH control socket where only the current user can write, preferring the per-user runtime directory and
+    # falling back to ~/.ssh for service users without a login session
+    control_path = config.get("Server", "ControlPath", raw=True, fallback=None)
+    if control_path is None:
+        runtime_dir = f"/run/user/{os.getuid()}"
+        socket_dir = runtime_dir if os.path.isdir(runtime_dir) else os.path.expanduser("~/.ssh")
+
+        # SSH exits (forcing the local fallback) if it can't bind the socket, so make sure its directory exists
+        try:
+            os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+        except OSError as e:
+            log.warning("Failed to create SSH control socket directory %s: %s", socket_dir, e)
+
+        control_path = f"{socket_dir}/frt-%C.sock"
+
+    # Load the ffmpeg and ffprobe binary locations for both the server and the client (used for local fallback)
+    contexts = ("Server", "Client")
+    ffmpeg_paths = { context: config.get(context, "FfmpegPath", fallback="/usr/bin/ffmpeg") for context in contexts }
+    ffprobe_paths = { context: config.get(context, "FfprobePath", fallback="/usr/bin/ffprobe") for context in contexts }
+
+    # Load how long to wait for files to be written back over the share
+    write_timeout = config.getint("Client", "WriteTimeout", fallback=3)
 
+def create_working_directory():
+    """
+    Creates the local working directory and holds it open
+    """
+    global localfd
+
+    os.makedirs(os.path.join(localdir, "dest"))
+
+    localfd = os.open(localdir, os.O_RDONLY | os.O_DIRECTORY | os.O_CLOEXEC)
+
+@functools.lru_cache(maxsize=1)
 def generate_ssh_command():
     """
-    Generates an SSH command to connect to the remote host
+    Generates an SSH command to connect to the remote host, which is only built once per run
 
-    :returns: A complete SSH command to prepend another command run on the remote host
+    :returns: A complete SSH command (as a tuple) to prepend another command run on the remote host
     """
     log.info("Generating SSH command...")
 
-    ssh_command = []
+    # Load SSH key for authentication
+    identity = [ "-i", identity_file ] if identity_file is not None else []
 
-    # Add the SSH command itself
-    ssh_command.extend(["ssh", "-q" ])
+    ssh_command = (
+        # Add the SSH command itself
+        "ssh", "-q",
 
-    # Set connection timeouts to fail fast
-    ssh_command.extend([ "-o", "ConnectTimeout=1" ])
-    ssh_command.extend([ "-o", "ConnectionAttempts=1" ])
+        # Set connection timeouts to fail fast
+        "-o", "ConnectTimeout=1",
+        "-o", "ConnectionAttempts=1",
 
-    # Don't fall back to interactive authentication
-    ssh_command.extend([ "-o", "BatchMode=yes" ])
+        # Don't fall back to interactive authentication
+        "-o", "BatchMode=yes",
 
-    # Don't perform server validation
-    ssh_command.extend([ "-o", "StrictHostKeyChecking=no" ])
-    ssh_command.extend([ "-o", "UserKnownHostsFile=/dev/null" ])
+        # Don't perform server validation
+        "-o", "StrictHostKeyChecking=no",
+        "-o", "UserKnownHostsFile=/dev/null",
 
-    # Create a persistent session to avoid the latency of setting up a tunnel for each subsequent FRT execution
-    persist = config.get("Server", "Persist", fallback=120)
-    ssh_command.extend([ "-o", "ControlMaster=auto" ])
-    ssh_command.extend([ "-o", "ControlPath=/run/shm/ssh-%r@%h:%p" ])
-    ssh_command.extend([ "-o", f"ControlPersist={persist}" ])
+        # Create a persistent session to avoid the latency of setting up a tunnel for each subsequent FRT execution
+        # The control socket is shared by every FRT process (including cleanup) so they all reuse the same master
+        "-o", "ControlMaster=auto",
+        "-o", f"ControlPath={control_path}",
+        "-o", f"ControlPersist={persist}",
 
-    # Load SSH key for authentication
-    key = config.get("Server", "IdentityFile", fallback=None)
-    if key is not None:
-        ssh_command.extend([ "-i", key ])
+        *identity,
 
-    # Load the remote host configuration
-    username = config.get("Server", "Username")
-    host = config.get("Server", "Host")
+        # Add login information
+        f"{username}@{host}",
+    )
 
-    # Add login information
-    ssh_command.append(f"{username}@{host}")
-    
     return ssh_command
 
+def make_directories(directory, created):
+    """
+    Creates a directory and all of its parents within the local working directory
+
+    :param directory: The directory to create, relative to the local working directory
+    :param created: The directories which have already been created, updated with any new ones
+    """
+    path = None
+    for part in directory.split("/"):
+        path = part if path is None else f"{path}/{part}"
+
+        if path not in created:
+            try:
+                os.mkdir(path, dir_fd=localfd)
+            except FileExistsError:
+                pass
+
+            created.add(path)
+
+def link_source(absolute, working):
+    """
+    Links a source file into the local working directory
+
+    :param absolute: The absolute path of the source file
+    :param working: The path to link it to, relative to the local working directory
+    """
+    try:
+        os.symlink(absolute, working, dir_fd=localfd)
+
+        log.info("Linked source file %s", absolute)
+    except FileExistsError:
+        pass
+
 def forward_reference(ffmpeg_command):
     """
     Link source files to the working directory
 
     :param ffmpeg_command: The ffmpeg command to parse
     """
+    # Track directories which have already been created, so each is only created once
+    created = set()
+
+    # Source files to link, keyed by their working path
+    links = {}
+
+    # Relative paths are all resolved against the same directory, so only look it up once
+    cwd = os.getcwd()
+
+    # Find the positions of all input files (those following an -i flag) in a single pass
+    inputs = { i + 1 for i, arg in enumerate(ffmpeg_command) if arg == "-i" }
+
     # Find and replace all file references with links
     for i, arg in enumerate(ffmpeg_command):
         # Detect if this is specifically indicated to be a file
         is_file = arg.startswith("file:")
         if is_file:
             arg = arg[5:]
+        # Flags are never files, so skip them before doing any path work
+        elif arg.startswith("-"):
+            continue
 
         # If the argument appears to be a normal file (the extension must contain a letter, to avoid linking timestamps)
-        extension = os.path.splitext(arg)[1]
-        if is_file or re.search(r"^\.(?=.*[a-zA-Z]).*$", extension):
-            absolute = os.path.abspath(arg)
+        # The extension starts after the last dot, as long as that dot is in the file name rather than a directory, and
+        # isn't part of the leading dots of a hidden file name (matching os.path.splitext)
+        name = arg.rfind("/") + 1
+        dot = arg.rfind(".")
+        if is_file or (dot > name and arg[name:dot].lstrip(".") and any(c.isalpha() for c in arg[dot + 1:])):
+            absolute = os.path.normpath(arg if os.path.isabs(arg) else os.path.join(cwd, arg))
 
-            relative = os.path.relpath(absolute, "/")
+            # The absolute path is already normalized, so it is relative to the root once the leading slashes are removed
+            relative = absolute.lstrip("/")
 
-            local_working = os.path.join(localdir, relative)
-            remote_working = os.path.join(remotedir, relative)
+            # Keep source files apart from output files, so only the latter are monitored
+            tree = "src" if i in inputs else "dest"
 
-            # Create all directories in the path
-            os.makedirs(os.path.dirname(local_working), exist_ok=True)
+            # Working paths are relative to the local working directory descriptor
+            working = f"{tree}/{relative}"
+            remote_working = f"{remotedir}/{working}"
 
-            # Link source files properly
-            if ffmpeg_command[i - 1] == "-i" and not os.path.islink(local_working):
-                os.symlink(absolute, local_working)
+            # Create all directories in the path
+            directory = working.rsplit("/", 1)[0]
+            if directory not in created:
+                make_directories(directory, created)
 
-                log.info(f"Linked source file {absolute}")
+            # Queue source files for linking (the same file may be used as an input more than once)
+            if i in inputs:
+                links[working] = absolute
 
             # Replace paths with adjusted remote working paths
             ffmpeg_command[i] = f"file:{remote_working}"
 
             # Note that no links are made for destination files as these are detected and linked at runtime
 
+    # Link source files, in parallel if there are several since each link is an independent (and possibly remote)
+    # filesystem operation
+    if len(links) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=min(len(links), 8)) as executor:
+            list(executor.map(link_source, links.values(), links.keys()))
+    else:
+        for working, absolute in links.items():
+            link_source(absolute, working)
+
 def reverse_reference():
     """
     Detects and links output files from ffmpeg to their final destination
 
     :returns: The file system observer, for easy stopping
     """
+    global observer
+
+    # Import watchdog lazily, since commands which never monitor for output shouldn't pay for it
+    from watchdog.observers import Observer
+
     # Create a file system observer
     observer = Observer()
 
     # Create a new monitor
     monitor = WorkingDirectoryMonitor(observer)
 
-    # Begin monitoring the directory
-    observer.schedule(monitor, localdir, recursive=True)
+    # Begin monitoring the output directory (source links would only generate noise)
+    observer.schedule(monitor, os.path.join(localdir, "dest"), recursive=True)
 
     # Begin monitoring the directory for changes
     observer.start()
@@ -191,104 +350,114 @@ def generate_ffmpeg_command(context):
     """
     Generate a properly escaped and transformed ffmpeg commandline
 
-    :returns: An ffmpeg/ffprobe command which can be run using SSH
+    :param context: Whether the command will be run on the server or the client
+    :returns: An ffmpeg/ffprobe command which can be run using SSH (or locally, using the original file paths)
     """
     log.info("Generating ffmpeg command...")
 
     ffmpeg_command = []
 
     # Start with the command that was used to run this script (should be ffmpeg or ffprobe)
-    if "ffprobe" in sys.argv[0]:
-        ffmpeg_command.append(config.get(context, "FfprobePath", fallback="/usr/bin/ffprobe"))
+    if ffprobe:
+        ffmpeg_command.append(ffprobe_paths[context])
     else:
-        ffmpeg_command.append(config.get(context, "FfmpegPath", fallback="/usr/bin/ffmpeg"))
+        ffmpeg_command.append(ffmpeg_paths[context])
 
     ffmpeg_command.extend(ffmpeg_args)
 
-    # Update file links and prepare working directory
-    forward_reference(ffmpeg_command)
+    # The client can use the original file paths as-is
+    if context == "Client":
+        return ffmpeg_command
+
+    # Update file links and prepare working directory (bypassing commands don't reference files)
+    if not bypass:
+        forward_reference(ffmpeg_command)
+
+    # Escape arguments for the remote shell (such as those including whitespace and invalid characters)
+    ffmpeg_command = [ shlex.quote(arg) for arg in ffmpeg_command ]
 
-    for i, arg in enumerate(ffmpeg_command):
-        # Escape malformed arguments (such as those including whitespace and invalid characters)
-        if re.search(r"[*()\s|\[\]]", arg):
-            ffmpeg_command[i] = f"\"{arg}\""
-        
     return ffmpeg_command
 
-def map_std(ffmpeg_command):
+def map_std():
     """
     Map standard in, out, and error based on the command that is being run
 
-    :param command: The ffmpeg command line which will be run
-    :returns: The standard in, out, and error to utilize when running ffmpeg
+    :returns: The standard in, out, and error file descriptors to utilize when running ffmpeg
     """
     log.info("Remapping standard in/out/error...")
 
+    # Pass raw file descriptors so ffmpeg's data streams are never buffered or decoded by this program (streams which
+    # were closed when this program started are None, and are simply inherited)
+    stdin = sys.stdin.fileno() if sys.stdin is not None else None
+    stderr = sys.stderr.fileno() if sys.stderr is not None else None
+
+    # Hand ffmpeg the log file descriptor directly if configured, so its output never passes through this program
+    if ffmpeg_logfd is not None:
+        stderr = ffmpeg_logfd
+
     # Redirect this program's stdout to stderr to prevent it interfering in a data stream
-    stdin = sys.stdin
-    stdout = sys.stderr
-    stderr = sys.stderr
+    stdout = stderr
 
     # Redirect stdout to stdout if a bypassing command or ffprobe is being run
-    if bypass or "ffprobe" in ffmpeg_command[0]:
-        stdout = sys.stdout
+    if bypass or ffprobe:
+        stdout = sys.stdout.fileno() if sys.stdout is not None else None
     
     return (stdin, stdout, stderr)
 
-def run_ffmpeg_command(context="Server"):
+def run_ffmpeg_command():
     """
-    Run the ffmpeg command, remapping I/O as necessary
+    Run the ffmpeg command on the server, remapping I/O as necessary and falling back to the client if the server
+    can't be reached
 
-    :param context: Whether to run the command on the server or the client
     :returns: The return code from the ffmpeg process
     """
-    ssh_command = generate_ssh_command()
-    ffmpeg_command = generate_ffmpeg_command(context)
+    ssh_command = list(generate_ssh_command())
+    ffmpeg_command = generate_ffmpeg_command("Server")
 
     # Remap the standard in, out, and error to properly handle data streams
-    (stdin, stdout, stderr) = map_std(ffmpeg_command)
+    (stdin, stdout, stderr) = map_std()
 
-    log.info(f"Running ffmpeg command on {context.lower()}...")
+    log.info("Running ffmpeg command on server...")
     log.info(ffmpeg_command)
 
-    # Determine whether to run the command locally or on the server
-    if context == "Server":
-        command = ssh_command + ffmpeg_command
-    elif context == "Client":
-        command = ffmpeg_command
-
-    # Begin watching for new files in the working directory
-    observer = reverse_reference()
+    # Begin watching for new files in the working directory, unless the command can't write any (bypassing commands
+    # and ffprobe only read)
+    observer = None
+    if not bypass and not ffprobe:
+        observer = reverse_reference()
 
     # Run the command
-    proc = subprocess.run(command, shell=False, bufsize=0, universal_newlines=True, stdin=stdin, stdout=stdout, stderr=stderr)
+    proc = subprocess.run(ssh_command + ffmpeg_command, shell=False, stdin=stdin, stdout=stdout, stderr=stderr)
 
     # Fall back to local ffmpeg if SSH could not connect
-    if context == "Server" and proc.returncode == 255:
+    if proc.returncode == 255:
         log.error("Failed to connect to remote host")
 
-        # Stop the existing observer
-        observer.stop()
+        if observer is not None:
+            # Stop the existing observer
+            observer.stop()
 
-        # Rejoin the thread, this will introduce a slight delay
-        observer.join()
+            # Rejoin the thread, this will introduce a slight delay
+            observer.join()
+
+        return run_ffmpeg_fallback(stdin, stdout, stderr)
 
-        return run_ffmpeg_command(context="Client")
+    # Without an observer there are no output files to wait for
+    if observer is None:
+        return proc.returncode
 
-    if context == "Server":
-        # Plant a canary to prevent a race condition due to SMB latency
-        command = ssh_command + [ "touch", os.path.join(remotedir, "canary.frt") ]
+    # Plant a canary to prevent a race condition due to SMB latency
+    command = ssh_command + [ "touch", os.path.join(remotedir, "dest", "canary.frt") ]
 
-        # Run the command on the remote host
-        subprocess.run(command, shell=False, bufsize=0, universal_newlines=True)
+    # Run the command on the remote host
+    subprocess.run(command, shell=False)
 
-        log.info("Waiting for observer to exit...")
+    log.info("Waiting for observer to exit...")
 
-        # Wait for the monitor thread to terminate after seeing the canary file
-        wait = config.getint("Client", "WriteTimeout", fallback=3)
-        observer.join(timeout=wait)
+    # Wait for the monitor thread to terminate after seeing the canary file
+    observer.join(timeout=write_timeout)
 
-    # Check if the observer joined correctly, or just is running locally
+    # Check if the observer joined correctly
     if observer.is_alive():
         # Stop the observer since the canary failed to do so
         observer.stop()
@@ -297,59 +466,127 @@ def run_ffmpeg_command(context="Server"):
         observer.join()
 
         # Long-running canaries mean a large amount of latency slowed down the transfer
-        context == "Server" and log.warning("Killed long-running observer, consider increasing WaitTimeout")
+        log.warning("Killed long-running observer, consider increasing WaitTimeout")
 
     # Return the ffmpeg return code
     return proc.returncode
 
+def run_ffmpeg_fallback(stdin, stdout, stderr):
+    """
+    Run the ffmpeg command on the client, reusing the already remapped I/O
+
+    :param stdin: The standard in file descriptor to utilize when running ffmpeg
+    :param stdout: The standard out file descriptor to utilize when running ffmpeg
+    :param stderr: The standard error file descriptor to utilize when running ffmpeg
+    :returns: The return code from the ffmpeg process
+    """
+    # Files are read and written in place, so none of the working directory setup needs to be repeated
+    ffmpeg_command = generate_ffmpeg_command("Client")
+
+    log.info("Running ffmpeg command on client...")
+    log.info(ffmpeg_command)
+
+    # Nothing needs to happen after a local bypassing command, so replace this process rather than waiting on it
+    if bypass:
+        # Install the remapped I/O as this process's own, since ffmpeg will inherit it across the exec
+        for fd, target in ((stdin, 0), (stdout, 1), (stderr, 2)):
+            if fd is not None and fd != target:
+                os.dup2(fd, target)
+
+        os.execvp(ffmpeg_command[0], ffmpeg_command)
+
+    proc = subprocess.run(ffmpeg_command, shell=False, stdin=stdin, stdout=stdout, stderr=stderr)
+
+    # Return the ffmpeg return code
+    return proc.returncode
+
+def log_teardown_error(function, path, error):
+    """
+    Logs a failure to remove part of the local working directory, so teardown can continue with the rest
+
+    :param function: The function which failed
+    :param path: The path which couldn't be removed
+    :param error: The exception raised by the failure
+    """
+    # Paths which are already gone (or were never created) don't need removing
+    if isinstance(error, FileNotFoundError):
+        return
+
+    log.warning("Failed to remove %s from the working directory: %s", path, error)
+
+def unlink_references():
+    """
+    Removes the local working directory and all file references within it
+    """
+    log.info("Unlinking file references...")
+
+    # The working directory may not have been created yet if cleanup was triggered early
+    if localfd is not None:
+        os.close(localfd)
+
+    # Remove the working side of every hard/soft link, the other end will be preserved (symlinks aren't followed)
+    # Python 3.12 replaced onerror (which receives the exception info tuple) with onexc
+    if sys.version_info >= (3, 12):
+        shutil.rmtree(localdir, onexc=log_teardown_error)
+    else:
+        shutil.rmtree(localdir, onerror=lambda function, path, exc_info: log_teardown_error(function, path, exc_info[1]))
+
 def cleanup(signum="", frame=""):
     """
     Cleans up local and remote files and processes, then exits
     """
     # Assemble variables needed for remote cleanup
-    ssh_command = generate_ssh_command()
-    user = config.get("Server", "Username")
+    ssh_command = list(generate_ssh_command())
 
-    # Creates a command to filter and kill orphaned processes owned by the current user
-    kill_command = [ "pkill", "-P1", "-u", user, "-f", "\"ffmpeg|ffprobe\"" ]
-    
-    # Kill all orphaned processes
-    log.info(f"Running cleanup command on remote server...")
+    # Creates a single remote command to filter and kill orphaned processes owned by the current user
+    kill_command = f"pkill -P1 -u {username} -f \"ffmpeg|ffprobe\""
+
+    # Stop monitoring before any working links are removed, otherwise their deletion would be mirrored onto the linked
+    # destination files
+    if observer is not None:
+        observer.stop()
+        observer.join()
+
+    # Kill all orphaned processes, without waiting so the remote round trip overlaps the local cleanup
+    log.info("Running cleanup command on remote server...")
     log.info(kill_command)
-    
-    subprocess.run(ssh_command + kill_command)
-    
-    log.info("Unlinking file references...")
-    for root, _, files in os.walk(localdir, topdown=False):
-        for file in files:
-            working = os.path.join(root, file)
 
-            # Remove the working side of the hard/soft link, the other end will be preserved
-            os.unlink(working)
+    proc = subprocess.Popen(ssh_command + [ kill_command ])
+
+    unlink_references()
+
+    # Wait for the remote cleanup to finish
+    proc.wait()
 
-        # Remove the current directory (walking starts from the lowest level)
-        os.rmdir(root)
-    
     log.info("Cleaned up, exiting")
 
     exit()
 
 def main():
+    load_config()
+
+    # Bypassing commands only print information and never reference files, so they need no working directory or cleanup
+    if bypass:
+        exit(run_ffmpeg_command())
+
     # Clean up after crashed
     signal.signal(signal.SIGTERM, cleanup)
     signal.signal(signal.SIGINT, cleanup)
     signal.signal(signal.SIGQUIT, cleanup)
     signal.signal(signal.SIGHUP, cleanup)
 
+    # Only create the working directory once cleanup is registered, so it can't be orphaned
+    create_working_directory()
+
     log.info("Beginning transcoding...")
 
     # Run ffmpeg on the remote host
     status = run_ffmpeg_command()
 
     if status == 0:
-        log.info(f"ffmpeg finished with return code {status}")
+        log.info("ffmpeg finished with return code %d", status)
     else:
-        log.error(f"ffmpeg exited with return code {status}")
+        log.error("ffmpeg exited with return code %d", status)
     
     cleanup()
 